@@ -1,11 +1,24 @@
 import streamlit as st
 import os
+import hashlib
 import tempfile
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterator, Tuple
+from langchain.schema import Document
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
 from rag_pipeline import RAGPipeline
 from utils import initialize_session_state, display_chat_message
 
+# Directory the vector store is persisted to between restarts
+INDEX_DIR = os.getenv("VECTOR_STORE_DIR", ".vector_store")
+
+# Number of chunks embedded and indexed together while ingesting a document
+INGEST_BATCH_SIZE = 64
+
+# Maximum number of processed uploads kept in the chunk cache
+CHUNK_CACHE_MAX_ENTRIES = 32
+
 # Page configuration
 st.set_page_config(
     page_title="Regulatory Compliance RAG Chatbot",
@@ -26,10 +39,86 @@ st.markdown("Upload regulatory documents and ask questions to get instant, conte
 def get_components():
     """Initialize and cache the main components"""
     doc_processor = DocumentProcessor()
-    vector_store = VectorStore()
+    vector_store = VectorStore.load(INDEX_DIR)
     rag_pipeline = RAGPipeline(vector_store)
     return doc_processor, vector_store, rag_pipeline
 
+@st.cache_resource
+def get_chunk_cache() -> "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]":
+    """Process-wide LRU cache of serializable chunks for processed uploads, keyed by (content hash, file name)"""
+    return OrderedDict()
+
+def iter_upload_chunks(file_bytes: bytes, file_name: str) -> Iterator[Document]:
+    """
+    Stream chunks from an uploaded file
+    
+    Args:
+        file_bytes: Raw file contents
+        file_name: Original name of the file
+        
+    Yields:
+        Document objects with text chunks and metadata
+    """
+    doc_processor = get_components()[0]
+    
+    # Save uploaded file temporarily
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_name.split('.')[-1]}") as tmp_file:
+        tmp_file.write(file_bytes)
+        tmp_file_path = tmp_file.name
+    
+    try:
+        yield from doc_processor.iter_chunks(tmp_file_path, file_name)
+    finally:
+        # Clean up temporary file
+        os.unlink(tmp_file_path)
+
+def ingest_upload(file_bytes: bytes, file_name: str) -> None:
+    """
+    Add an uploaded file to the vector store in bounded batches
+    
+    Chunks are embedded while the file is still being extracted; identical
+    uploads are replayed from the chunk cache without re-processing. If any
+    batch fails, chunks already added for this file are removed again.
+    
+    Args:
+        file_bytes: Raw file contents
+        file_name: Original name of the file
+    """
+    vector_store = get_components()[1]
+    chunk_cache = get_chunk_cache()
+    # Chunk metadata records the source name, so the same bytes under another name are a separate entry
+    cache_key = (hashlib.sha256(file_bytes).hexdigest(), file_name)
+    
+    cached_chunks = chunk_cache.get(cache_key)
+    if cached_chunks is not None:
+        chunk_cache.move_to_end(cache_key)
+        chunks = (Document(**chunk) for chunk in cached_chunks)
+    else:
+        chunks = iter_upload_chunks(file_bytes, file_name)
+    
+    # Remember where this file starts so a failure partway through can be rolled back
+    checkpoint = len(vector_store.contents)
+    collected = []
+    batch = []
+    try:
+        for chunk in chunks:
+            batch.append(chunk)
+            if cached_chunks is None:
+                collected.append({'page_content': chunk.page_content, 'metadata': chunk.metadata})
+            if len(batch) >= INGEST_BATCH_SIZE:
+                vector_store.add_documents(batch)
+                batch = []
+        vector_store.add_documents(batch)
+    except Exception:
+        vector_store.truncate(checkpoint)
+        raise
+    
+    # Only cache uploads that were processed completely
+    if cached_chunks is None:
+        chunk_cache[cache_key] = collected
+        while len(chunk_cache) > CHUNK_CACHE_MAX_ENTRIES:
+            chunk_cache.popitem(last=False)
+
 try:
     doc_processor, vector_store, rag_pipeline = get_components()
 except Exception as e:
@@ -37,6 +126,10 @@ except Exception as e:
     st.error("Please ensure your OpenAI API key is properly configured.")
     st.stop()
 
+# Documents persisted from a previous run are available immediately
+if vector_store.index.ntotal > 0:
+    st.session_state.documents_loaded = True
+
 # Sidebar for document management
 with st.sidebar:
     st.header("📄 Document Management")
@@ -66,19 +159,8 @@ with st.sidebar:
                 
                 for idx, uploaded_file in enumerate(uploaded_files):
                     try:
-                        # Save uploaded file temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                            tmp_file.write(uploaded_file.getvalue())
-                            tmp_file_path = tmp_file.name
-                        
-                        # Process document
-                        chunks = doc_processor.process_document(tmp_file_path, uploaded_file.name)
-                        
-                        # Add to vector store
-                        vector_store.add_documents(chunks)
-                        
-                        # Clean up temporary file
-                        os.unlink(tmp_file_path)
+                        # Process document and add it to the vector store
+                        ingest_upload(uploaded_file.getvalue(), uploaded_file.name)
                         
                         # Update progress
                         progress_bar.progress((idx + 1) / len(uploaded_files))
@@ -86,6 +168,12 @@ with st.sidebar:
                     except Exception as e:
                         st.error(f"Error processing {uploaded_file.name}: {str(e)}")
                 
+                # Persist once per upload rather than after every batch
+                try:
+                    vector_store.save(INDEX_DIR)
+                except Exception as e:
+                    st.error(str(e))
+                
                 st.success(f"Successfully processed {len(uploaded_files)} document(s)!")
                 st.session_state.documents_loaded = True
     
@@ -122,34 +210,34 @@ if prompt := st.chat_input("Ask about regulatory compliance..."):
         
         # Generate response
         with st.chat_message("assistant"):
-            with st.spinner("Searching documents and generating response..."):
-                try:
-                    response = rag_pipeline.get_response(prompt, st.session_state.user_role)
-                    
-                    # Display main response
-                    st.markdown(response['answer'])
-                    
-                    # Display sources
-                    if response['sources']:
-                        with st.expander("📚 Sources", expanded=False):
-                            for i, source in enumerate(response['sources'], 1):
-                                st.markdown(f"**Source {i}:** {source['document']}")
-                                st.markdown(f"*Relevance Score: {source['score']:.2f}*")
-                                st.markdown(f"```\n{source['content'][:300]}...\n```")
-                                st.markdown("---")
-                    
-                    # Add assistant response to chat history
-                    assistant_message = {
-                        "role": "assistant", 
-                        "content": response['answer'],
-                        "sources": response['sources']
-                    }
-                    st.session_state.chat_history.append(assistant_message)
-                    
-                except Exception as e:
-                    error_msg = f"Error generating response: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+            try:
+                with st.spinner("Searching documents..."):
+                    response = rag_pipeline.stream_response(prompt, st.session_state.user_role)
+                
+                # Display main response as it is generated
+                answer = st.write_stream(response['answer_stream'])
+                
+                # Display sources
+                if response['sources']:
+                    with st.expander("📚 Sources", expanded=False):
+                        for i, source in enumerate(response['sources'], 1):
+                            st.markdown(f"**Source {i}:** {source['document']}")
+                            st.markdown(f"*Relevance Score: {source['score']:.2f}*")
+                            st.markdown(f"```\n{source['content'][:300]}...\n```")
+                            st.markdown("---")
+                
+                # Add assistant response to chat history
+                assistant_message = {
+                    "role": "assistant", 
+                    "content": answer,
+                    "sources": response['sources']
+                }
+                st.session_state.chat_history.append(assistant_message)
+                
+            except Exception as e:
+                error_msg = f"Error generating response: {str(e)}"
+                st.error(error_msg)
+                st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
 
 # Footer
 st.markdown("---")
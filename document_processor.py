@@ -1,29 +1,180 @@
 import os
-from typing import List, Dict
-import PyPDF2
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import mmap
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterator, Iterable, Optional, Callable, NamedTuple, Any
+import pypdfium2 as pdfium
+import tiktoken
+from semantic_text_splitter import TextSplitter
 from langchain.schema import Document
 
+def _extract_pdf_page(pdf: pdfium.PdfDocument, page_num: int) -> Optional[str]:
+    """
+    Extract text from a single page of an open PDF
+    
+    Args:
+        pdf: Open PDF document
+        page_num: Index of the page to extract
+        
+    Returns:
+        Page text, or None if extraction failed
+    """
+    try:
+        page = pdf[page_num]
+        text_page = page.get_textpage()
+        try:
+            return text_page.get_text_range()
+        finally:
+            text_page.close()
+            page.close()
+    except Exception as e:
+        print(f"Warning: Error extracting text from page {page_num + 1}: {str(e)}")
+        return None
+
+def _extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """
+    Extract text from a contiguous range of PDF pages
+    
+    Defined at module level so it can be sent to worker processes.
+    
+    Args:
+        file_path: Path to the PDF file
+        start: Index of the first page to extract
+        stop: Index one past the last page to extract
+        
+    Returns:
+        List of (page index, page text) tuples for pages that contain text
+    """
+    pages = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for page_num in range(start, stop):
+            page_text = _extract_pdf_page(pdf, page_num)
+            if page_text:
+                pages.append((page_num, page_text))
+    finally:
+        pdf.close()
+    
+    return pages
+
+class _SizedChunk(NamedTuple):
+    """A chunk of text with its token count and position in the extracted sections"""
+    text: str
+    token_count: int
+    metadata: Dict[str, Any]  # Metadata of the section the chunk starts in
+    section: int  # Index of the section the chunk starts in
+    start: int  # Character offset of the chunk within its starting section
+    end_section: int  # Index of the section the chunk ends in
+    end: int  # Character offset one past the chunk's end within end_section
+
+def _join_chunk_texts(previous: _SizedChunk, following: _SizedChunk, separator: str = "\n") -> str:
+    """
+    Join two consecutive chunks, dropping the text they overlap on
+    
+    Chunks from the same section are joined on their shared overlap; chunks
+    from different sections (or separated by trimmed whitespace) are joined
+    with the separator.
+    
+    Args:
+        previous: Earlier chunk
+        following: Chunk immediately after previous
+        separator: String placed between chunks that do not overlap
+        
+    Returns:
+        Combined chunk text
+    """
+    if following.section == previous.end_section:
+        overlap = previous.end - following.start
+        if overlap >= 0:
+            return previous.text + following.text[overlap:]
+    
+    return previous.text + separator + following.text
+
+def _merge_tiny_chunks(
+    chunks: Iterable[_SizedChunk],
+    min_size: int,
+    cap: int,
+    length_function: Callable[[str], int],
+    separator: str = "\n"
+) -> Iterator[_SizedChunk]:
+    """
+    Merge chunks shorter than min_size tokens into a neighbouring chunk
+    
+    Chunks are merged across section boundaries, so a short page joins the
+    end of the previous page. Only one chunk is held back at a time.
+    
+    Args:
+        chunks: Chunks in document order
+        min_size: Chunks shorter than this many tokens are merged
+        cap: Maximum token length of a merged chunk
+        length_function: Returns the token length of a text
+        separator: String placed between chunks that do not overlap
+        
+    Yields:
+        Chunks in document order
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is not None and (chunk.token_count < min_size or pending.token_count < min_size):
+            merged_text = _join_chunk_texts(pending, chunk, separator)
+            merged_length = length_function(merged_text)
+            if merged_length <= cap:
+                pending = pending._replace(
+                    text=merged_text,
+                    token_count=merged_length,
+                    end_section=chunk.end_section,
+                    end=chunk.end
+                )
+                continue
+        
+        if pending is not None:
+            yield pending
+        pending = chunk
+    
+    if pending is not None:
+        yield pending
+
 class DocumentProcessor:
     """Handles document processing and chunking for RAG pipeline"""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    # PDFs with fewer pages are extracted serially to avoid process pool startup cost
+    PARALLEL_PDF_MIN_PAGES = 8
+    # Pages extracted per worker task, and task results buffered per worker, when extracting in parallel
+    PDF_PAGES_PER_TASK = 16
+    PDF_TASKS_PER_WORKER = 2
+    
+    # Text files larger than this are memory-mapped rather than read into a buffer
+    MMAP_MIN_BYTES = 10 * 1024 * 1024
+    
+    # Chunks shorter than this many tokens are merged into a neighbour
+    MIN_CHUNK_SIZE = 25
+    # Merged chunks may not exceed this multiple of chunk_size
+    MERGE_CAP_RATIO = 1.1
+    
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 100):
         """
         Initialize document processor
         
         Args:
-            chunk_size: Size of text chunks for processing
-            chunk_overlap: Overlap between consecutive chunks
+            chunk_size: Size of text chunks for processing, in tokens
+            chunk_overlap: Overlap between consecutive chunks, in tokens
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        # Tokenizer matching the embedding model, so chunk sizes reflect what the API counts
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        # Rust-backed splitter with its native cl100k_base sizer; splits on the coarsest semantic boundary that fits
+        self.text_splitter = TextSplitter.from_tiktoken_model(
+            "gpt-3.5-turbo",
+            capacity=chunk_size,
+            overlap=chunk_overlap
         )
     
+    def _length(self, text: str) -> int:
+        """Return the number of tokens in text"""
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
     def process_document(self, file_path: str, file_name: str) -> List[Document]:
         """
         Process a document and return chunks
@@ -35,79 +186,161 @@ class DocumentProcessor:
         Returns:
             List of Document objects with text chunks and metadata
         """
+        chunks = list(self.iter_chunks(file_path, file_name))
+        
+        for chunk in chunks:
+            chunk.metadata["total_chunks"] = len(chunks)
+        
+        return chunks
+    
+    def iter_chunks(self, file_path: str, file_name: str) -> Iterator[Document]:
+        """
+        Process a document lazily, yielding chunks as each section is split
+        
+        PDFs are split page by page. Serial extraction holds one page of text at
+        a time; parallel extraction holds at most a bounded window of page ranges.
+        Since the total is not known up front, chunks carry no
+        "total_chunks" metadata; use process_document if that is needed.
+        
+        Args:
+            file_path: Path to the document file
+            file_name: Original name of the file
+            
+        Yields:
+            Document objects with text chunks and metadata
+        """
         try:
-            # Extract text based on file type
+            # Extract text sections based on file type
             if file_path.lower().endswith('.pdf'):
-                text = self._extract_pdf_text(file_path)
+                sections = self._extract_pdf_text(file_path)
             elif file_path.lower().endswith('.txt'):
-                text = self._extract_txt_text(file_path)
+                sections = iter([self._extract_txt_text(file_path)])
             else:
                 raise ValueError(f"Unsupported file type: {file_path}")
             
-            if not text.strip():
-                raise ValueError(f"No text content found in {file_name}")
+            base_metadata = {
+                "source": file_name,
+                "file_path": file_path,
+                "file_type": file_path.split('.')[-1].lower()
+            }
             
-            # Create document object
-            document = Document(
-                page_content=text,
-                metadata={
-                    "source": file_name,
-                    "file_path": file_path,
-                    "file_type": file_path.split('.')[-1].lower(),
-                    "char_count": len(text)
-                }
+            chunk_id = 0
+            merged_chunks = _merge_tiny_chunks(
+                self._iter_sized_chunks(sections, base_metadata),
+                min_size=self.MIN_CHUNK_SIZE,
+                cap=int(self.chunk_size * self.MERGE_CAP_RATIO),
+                length_function=self._length
             )
             
-            # Split into chunks
-            chunks = self.text_splitter.split_documents([document])
+            # Wrap each chunk with its metadata
+            for sized_chunk in merged_chunks:
+                chunk = Document(
+                    page_content=sized_chunk.text,
+                    metadata={
+                        **sized_chunk.metadata,
+                        "chunk_id": chunk_id,
+                        "chunk_size": len(sized_chunk.text),
+                        "token_count": sized_chunk.token_count
+                    }
+                )
+                chunk_id += 1
+                yield chunk
             
-            # Add chunk metadata
-            for i, chunk in enumerate(chunks):
-                chunk.metadata.update({
-                    "chunk_id": i,
-                    "total_chunks": len(chunks),
-                    "chunk_size": len(chunk.page_content)
-                })
-            
-            return chunks
+            if chunk_id == 0:
+                raise ValueError(f"No text content found in {file_name}")
             
         except Exception as e:
             raise Exception(f"Error processing document {file_name}: {str(e)}")
     
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file"""
+    def _iter_sized_chunks(self, sections: Iterable[str], base_metadata: Dict[str, Any]) -> Iterator[_SizedChunk]:
+        """
+        Split each text section into chunks, tokenizing each chunk once
+        
+        Args:
+            sections: Text sections (PDF pages or a whole TXT file) in document order
+            base_metadata: Metadata shared by every chunk of the document
+            
+        Yields:
+            Chunks with token counts and section offsets
+        """
+        for section, text in enumerate(sections):
+            if not text.strip():
+                continue
+            
+            section_metadata = {**base_metadata, "char_count": len(text)}
+            for start, chunk_text in self.text_splitter.chunk_indices(text):
+                yield _SizedChunk(
+                    text=chunk_text,
+                    token_count=self._length(chunk_text),
+                    metadata=section_metadata,
+                    section=section,
+                    start=start,
+                    end_section=section,
+                    end=start + len(chunk_text)
+                )
+    
+    def _extract_pdf_text(self, file_path: str) -> Iterator[str]:
+        """Extract text from PDF file, yielding one page section at a time"""
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
+            pdf = pdfium.PdfDocument(file_path)
+            try:
+                page_count = len(pdf)
+                workers = min(os.cpu_count() or 1, page_count)
+                if page_count < self.PARALLEL_PDF_MIN_PAGES or workers < 2:
+                    for page_num in range(page_count):
+                        page_text = _extract_pdf_page(pdf, page_num)
                         if page_text:
-                            text += f"\n--- Page {page_num + 1} ---\n"
-                            text += page_text
-                    except Exception as e:
-                        print(f"Warning: Error extracting text from page {page_num + 1}: {str(e)}")
-                        continue
+                            yield f"--- Page {page_num + 1} ---\n{page_text}"
+                    return
+            finally:
+                pdf.close()
             
-            return text.strip()
+            yield from self._extract_pdf_text_parallel(file_path, page_count, workers)
             
         except Exception as e:
             raise Exception(f"Error reading PDF file: {str(e)}")
     
+    def _extract_pdf_text_parallel(self, file_path: str, page_count: int, workers: int) -> Iterator[str]:
+        """Extract PDF pages in worker processes, keeping a bounded window of page ranges in flight"""
+        step = self.PDF_PAGES_PER_TASK
+        starts = iter(range(0, page_count, step))
+        pending = deque()
+        
+        # Forking the multi-threaded Streamlit server is deadlock-prone, so start workers from a forkserver
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+        try:
+            def submit_next() -> None:
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(
+                        executor.submit(_extract_pdf_page_range, file_path, start, min(start + step, page_count))
+                    )
+            
+            for _ in range(workers * self.PDF_TASKS_PER_WORKER):
+                submit_next()
+            
+            # Ranges are submitted in page order, so consuming futures in order keeps pages ordered
+            while pending:
+                pages = pending.popleft().result()
+                submit_next()
+                for page_num, page_text in pages:
+                    yield f"--- Page {page_num + 1} ---\n{page_text}"
+        finally:
+            executor.shutdown(cancel_futures=True)
+    
     def _extract_txt_text(self, file_path: str) -> str:
         """Extract text from TXT file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except UnicodeDecodeError:
-            # Try with different encoding
-            try:
-                with open(file_path, 'r', encoding='latin-1') as file:
-                    return file.read()
-            except Exception as e:
-                raise Exception(f"Error reading text file with multiple encodings: {str(e)}")
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size > self.MMAP_MIN_BYTES:
+                    # Decode straight from the mapped pages without an intermediate bytes copy
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        return str(mapped, 'utf-8', 'replace')
+                
+                return file.read().decode('utf-8', errors='replace')
         except Exception as e:
             raise Exception(f"Error reading text file: {str(e)}")
     
@@ -0,0 +1,12 @@
+import os
+import httpx
+from openai import OpenAI
+
+# Shared OpenAI client so embedding and chat requests reuse one connection pool
+api_key = os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
+client = OpenAI(
+    api_key=api_key,
+    http_client=httpx.Client(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+    )
+)
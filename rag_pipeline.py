@@ -1,23 +1,110 @@
-import os
-from typing import Dict, List, Any
-from openai import OpenAI
+import io
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterator
+from openai_client import client
 from vector_store import VectorStore
 
+class QueryCache:
+    """Thread-safe LRU cache of RAG responses with TTL expiry"""
+    
+    def __init__(self, max_size: int = 2000, ttl: float = 300.0):
+        """
+        Initialize query cache
+        
+        Args:
+            max_size: Maximum number of cached responses
+            ttl: Time-to-live of a cached response in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._version = None
+    
+    @staticmethod
+    def make_key(query: str, user_role: str, k: int) -> str:
+        """Build the cache key for a query"""
+        normalized = f"{query.strip().lower()}\x00{user_role}\x00{k}"
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    def _sync_version(self, version: int) -> None:
+        """Drop all entries if the underlying vector store has changed"""
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+    
+    def get(self, key: str, version: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response
+        
+        Args:
+            key: Cache key from make_key
+            version: Current vector store version
+            
+        Returns:
+            Cached response dictionary, or None on a miss
+        """
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            timestamp, response = entry
+            if time.time() - timestamp > self.ttl:
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return response
+    
+    def put(self, key: str, response: Dict[str, Any], version: int) -> None:
+        """
+        Store a response
+        
+        Args:
+            key: Cache key from make_key
+            response: Response dictionary to cache
+            version: Vector store version the response was computed against
+        """
+        with self._lock:
+            # A response computed before the store last changed is stale; drop it without clearing
+            if self._version is not None and version < self._version:
+                return
+            
+            self._sync_version(version)
+            self._entries[key] = (time.time(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        with self._lock:
+            self._entries.clear()
+
 class RAGPipeline:
     """RAG (Retrieval Augmented Generation) pipeline for compliance Q&A"""
     
-    def __init__(self, vector_store: VectorStore):
+    # Maximum characters of document content sent for summarization, to avoid token limits
+    SUMMARY_MAX_CHARS = 4000
+    
+    def __init__(self, vector_store: VectorStore, query_cache: Optional[QueryCache] = None):
         """
         Initialize RAG pipeline
         
         Args:
             vector_store: Vector store instance for document retrieval
+            query_cache: Optional cache for responses; a default in-memory cache is used if omitted
         """
         self.vector_store = vector_store
+        self.query_cache = query_cache if query_cache is not None else QueryCache()
         
-        # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
-        self.openai_client = OpenAI(api_key=api_key)
+        # Shared OpenAI client
+        self.openai_client = client
         
         # the newest OpenAI model is "gpt-5" which was released August 7, 2025.
         # do not change this unless explicitly requested by the user
@@ -35,14 +122,48 @@ class RAGPipeline:
         Returns:
             Dictionary containing answer and sources
         """
+        response = self.stream_response(query, user_role, k=k)
+        
+        return {
+            'answer': "".join(response['answer_stream']),
+            'sources': response['sources'],
+            'context_used': response['context_used']
+        }
+    
+    def stream_response(self, query: str, user_role: str, k: int = 5) -> Dict[str, Any]:
+        """
+        Get RAG response for a query, streaming the answer as it is generated
+        
+        Retrieval happens before this returns; the answer itself is generated
+        lazily as 'answer_stream' is consumed, and is cached once complete.
+        
+        Args:
+            query: User question
+            user_role: User's role (Compliance Analyst or Relationship Manager)
+            k: Number of documents to retrieve
+            
+        Returns:
+            Dictionary containing an iterator of answer text deltas and sources
+        """
+        cache_key = QueryCache.make_key(query, user_role, k)
+        store_version = self.vector_store.version
+        cached_response = self.query_cache.get(cache_key, store_version)
+        if cached_response is not None:
+            return {
+                'answer_stream': iter([cached_response['answer']]),
+                'sources': cached_response['sources'],
+                'context_used': cached_response['context_used']
+            }
+        
         try:
             # Step 1: Retrieve relevant documents
             relevant_docs = self.vector_store.similarity_search(query, k=k)
             
             if not relevant_docs:
                 return {
-                    'answer': "I couldn't find relevant information in the uploaded documents to answer your question. Please ensure you've uploaded the appropriate regulatory documents or try rephrasing your question.",
-                    'sources': []
+                    'answer_stream': iter(["I couldn't find relevant information in the uploaded documents to answer your question. Please ensure you've uploaded the appropriate regulatory documents or try rephrasing your question."]),
+                    'sources': [],
+                    'context_used': 0
                 }
             
             # Step 2: Prepare context from retrieved documents
@@ -51,8 +172,8 @@ class RAGPipeline:
             # Step 3: Generate role-specific prompt
             prompt = self._create_role_specific_prompt(query, context, user_role)
             
-            # Step 4: Generate response using OpenAI
-            response = self.openai_client.chat.completions.create(
+            # Step 4: Start streaming response from OpenAI
+            stream = self.openai_client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {
@@ -65,40 +186,60 @@ class RAGPipeline:
                     }
                 ],
                 temperature=0.3,  # Lower temperature for more consistent responses
-                max_tokens=1000
+                max_tokens=1000,
+                stream=True
             )
             
-            answer = response.choices[0].message.content
-            
             # Step 5: Format sources
             sources = self._format_sources(relevant_docs)
             
-            return {
-                'answer': answer,
-                'sources': sources,
-                'context_used': len(relevant_docs)
-            }
-            
         except Exception as e:
             return {
-                'answer': f"I encountered an error while processing your question: {str(e)}. Please try again or contact support if the issue persists.",
-                'sources': []
+                'answer_stream': iter([self._error_message(e)]),
+                'sources': [],
+                'context_used': 0
             }
+        
+        result = {
+            'sources': sources,
+            'context_used': len(relevant_docs)
+        }
+        
+        return {
+            'answer_stream': self._stream_answer(stream, cache_key, store_version, result),
+            **result
+        }
+    
+    def _stream_answer(self, stream, cache_key: str, store_version: int, result: Dict[str, Any]) -> Iterator[str]:
+        """Yield answer deltas from a completion stream, caching the full answer when it completes"""
+        parts = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            yield self._error_message(e)
+            return
+        finally:
+            # Release the HTTP connection even if the consumer stops early
+            stream.close()
+        
+        self.query_cache.put(cache_key, {'answer': "".join(parts), **result}, store_version)
+    
+    def _error_message(self, error: Exception) -> str:
+        """Build the user-facing message for a failed response"""
+        return f"I encountered an error while processing your question: {str(error)}. Please try again or contact support if the issue persists."
     
     def _prepare_context(self, documents: List[Dict[str, Any]]) -> str:
         """Prepare context string from retrieved documents"""
-        context_parts = []
-        
-        for i, doc in enumerate(documents, 1):
-            source = doc.get('source', 'Unknown Document')
-            content = doc.get('content', '')
-            score = doc.get('score', 0)
-            
-            context_parts.append(
-                f"[Source {i}: {source} (Relevance: {score:.2f})]\n{content}\n"
-            )
-        
-        return "\n".join(context_parts)
+        return "\n".join(
+            f"[Source {i}: {doc.get('source', 'Unknown Document')} (Relevance: {doc.get('score', 0):.2f})]\n{doc.get('content', '')}\n"
+            for i, doc in enumerate(documents, 1)
+        )
     
     def _get_system_prompt(self, user_role: str) -> str:
         """Get role-specific system prompt"""
@@ -149,19 +290,19 @@ Please provide your response:
     
     def _format_sources(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Format source information for display"""
-        sources = []
-        
-        for doc in documents:
-            source_info = {
-                'document': doc.get('source', 'Unknown Document'),
-                'content': doc.get('content', '')[:500] + '...' if len(doc.get('content', '')) > 500 else doc.get('content', ''),
-                'score': doc.get('score', 0),
-                'chunk_id': doc.get('chunk_id', 0),
-                'file_type': doc.get('file_type', 'unknown')
-            }
-            sources.append(source_info)
+        return [self._format_source(doc) for doc in documents]
+    
+    def _format_source(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a single retrieved document for display"""
+        content = doc.get('content', '')
         
-        return sources
+        return {
+            'document': doc.get('source', 'Unknown Document'),
+            'content': content[:500] + '...' if len(content) > 500 else content,
+            'score': doc.get('score', 0),
+            'chunk_id': doc.get('chunk_id', 0),
+            'file_type': doc.get('file_type', 'unknown')
+        }
     
     def get_document_summary(self, source: str) -> str:
         """Get a summary of a specific document"""
@@ -171,15 +312,15 @@ Please provide your response:
             if not doc_chunks:
                 return f"No document found with source: {source}"
             
-            # Combine all chunks from the document
-            full_content = "\n".join([chunk.get('content', '') for chunk in doc_chunks])
+            # Combine chunks from the document, stopping once the content limit is reached
+            full_content = self._join_chunks(doc_chunks, self.SUMMARY_MAX_CHARS)
             
             prompt = f"""
 Please provide a comprehensive summary of the following regulatory document:
 
 DOCUMENT: {source}
 CONTENT:
-{full_content[:4000]}  # Limit content to avoid token limits
+{full_content}
 
 Please provide a structured summary including:
 1. Document purpose and scope
@@ -206,3 +347,22 @@ Please provide a structured summary including:
             
         except Exception as e:
             return f"Error generating document summary: {str(e)}"
+    
+    @staticmethod
+    def _join_chunks(chunks: List[Dict[str, Any]], max_chars: int) -> str:
+        """Join chunk contents with newlines, truncated to max_chars without building the full string"""
+        buffer = io.StringIO()
+        total = 0
+        for chunk in chunks:
+            if total >= max_chars:
+                break
+            
+            content = chunk.get('content', '')[:max_chars - total]
+            buffer.write(content)
+            total += len(content)
+            
+            if total < max_chars:
+                buffer.write("\n")
+                total += 1
+        
+        return buffer.getvalue()
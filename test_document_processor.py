@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("pypdfium2")
+pytest.importorskip("tiktoken")
+pytest.importorskip("semantic_text_splitter")
+pytest.importorskip("langchain")
+
+from document_processor import _SizedChunk, _join_chunk_texts, _merge_tiny_chunks
+
+
+def make_chunk(text, section, start):
+    return _SizedChunk(
+        text=text,
+        token_count=len(text),
+        metadata={"section": section},
+        section=section,
+        start=start,
+        end_section=section,
+        end=start + len(text)
+    )
+
+
+def merge(chunks, min_size=5, cap=100):
+    return list(_merge_tiny_chunks(chunks, min_size=min_size, cap=cap, length_function=len))
+
+
+def test_join_trims_overlap_within_section():
+    previous = make_chunk("alpha beta gamma", 0, 0)
+    following = make_chunk("gamma delta", 0, 11)
+    assert _join_chunk_texts(previous, following) == "alpha beta gamma delta"
+
+
+def test_join_uses_separator_across_sections():
+    previous = make_chunk("end of page", 0, 0)
+    following = make_chunk("page two", 1, 0)
+    assert _join_chunk_texts(previous, following) == "end of page\npage two"
+
+
+def test_join_uses_separator_for_gap_within_section():
+    previous = make_chunk("first", 0, 0)
+    following = make_chunk("second", 0, 7)
+    assert _join_chunk_texts(previous, following) == "first\nsecond"
+
+
+def test_tiny_chunk_merges_into_previous_section():
+    chunks = [make_chunk("a long first page", 0, 0), make_chunk("tiny", 1, 0)]
+    merged = merge(chunks)
+    assert [chunk.text for chunk in merged] == ["a long first page\ntiny"]
+    assert merged[0].metadata == {"section": 0}
+    assert merged[0].end_section == 1
+
+
+def test_merge_respects_cap():
+    chunks = [make_chunk("x" * 98, 0, 0), make_chunk("yy", 0, 98)]
+    assert [chunk.text for chunk in merge(chunks, cap=99)] == ["x" * 98, "yy"]
+
+
+def test_overlap_is_not_repeated_after_cross_section_merge():
+    chunks = [
+        make_chunk("page one text", 0, 0),
+        make_chunk("ab", 1, 0),
+        make_chunk("bcd", 1, 1)
+    ]
+    assert [chunk.text for chunk in merge(chunks)] == ["page one text\nabcd"]
+
+
+def test_large_chunks_pass_through_unchanged():
+    chunks = [make_chunk("first chunk", 0, 0), make_chunk("second chunk", 0, 11)]
+    assert merge(chunks) == chunks
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain")
+pytest.importorskip("openai")
+
+from rag_pipeline import RAGPipeline
+
+
+def test_join_chunks_exact_boundary_does_not_exceed_cap():
+    chunks = [{'content': 'a' * 4000}, {'content': 'b' * 1500}]
+    assert RAGPipeline._join_chunks(chunks, 4000) == 'a' * 4000
+
+
+def test_join_chunks_boundary_across_multiple_chunks():
+    chunks = [{'content': 'a' * 1999}, {'content': 'b' * 2000}, {'content': 'c' * 1500}]
+    joined = RAGPipeline._join_chunks(chunks, 4000)
+    assert len(joined) == 4000
+    assert joined == 'a' * 1999 + '\n' + 'b' * 2000
+
+
+def test_join_chunks_under_cap_keeps_all_content():
+    chunks = [{'content': 'first'}, {'content': 'second'}]
+    assert RAGPipeline._join_chunks(chunks, 4000) == 'first\nsecond\n'
@@ -1,31 +1,246 @@
 import os
+import pickle
+import hashlib
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import faiss
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from langchain.schema import Document
-from openai import OpenAI
+from openai import RateLimitError
+from openai_client import client
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+class EmbeddingCache:
+    """SQLite-backed cache of embeddings keyed by (content hash, model)"""
+    
+    def __init__(self, db_path: str = ".embedding_cache.sqlite3"):
+        """
+        Initialize embedding cache
+        
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "hash TEXT NOT NULL, "
+            "model TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (hash, model))"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Return the SHA-256 hex digest used as the cache key for a text"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def get_many(self, hashes: List[str], model: str) -> Dict[str, np.ndarray]:
+        """
+        Look up cached embeddings for a batch of hashes
+        
+        Args:
+            hashes: Content hashes to look up
+            model: Embedding model name
+            
+        Returns:
+            Dictionary mapping each cached hash to its embedding vector
+        """
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        # Stay well below SQLite's bound-parameter limit
+        batch_size = 500
+        with self._lock:
+            for start in range(0, len(unique_hashes), batch_size):
+                batch = unique_hashes[start:start + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        
+        hits = sum(1 for text_hash in hashes if text_hash in found)
+        self.cache_hits += hits
+        self.cache_misses += len(hashes) - hits
+        return found
+    
+    def put_many(self, hashes: List[str], embeddings: np.ndarray, model: str) -> None:
+        """
+        Store a batch of embeddings
+        
+        Args:
+            hashes: Content hashes, aligned with the rows of embeddings
+            embeddings: Array of embedding vectors
+            model: Embedding model name
+        """
+        rows = [
+            (text_hash, model, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in zip(hashes, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, model, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters"""
+        return {
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses
+        }
 
 class VectorStore:
     """FAISS-based vector store for document embeddings"""
     
-    def __init__(self, embedding_dimension: int = 1536):
+    # Maximum number of texts sent in a single embeddings request
+    EMBEDDING_BATCH_SIZE = 96
+    # Maximum number of embeddings requests in flight at once
+    EMBEDDING_MAX_WORKERS = 8
+    
+    # Below this many vectors a brute-force scan is faster than HNSW
+    HNSW_MIN_VECTORS = 1000
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 200
+    HNSW_EF_SEARCH = 64
+    
+    # Vectors needed to train the int8 scalar quantizer; full-precision storage is used until then
+    SQ_MIN_TRAINING_VECTORS = 10000
+    
+    # Source-filtered searches over at most this many vectors are scored exactly on HNSW indexes
+    FILTER_EXACT_MAX_VECTORS = 4096
+    
+    INDEX_FILENAME = "faiss.idx"
+    METADATA_FILENAME = "meta.pkl"
+    
+    def __init__(
+        self,
+        embedding_dimension: int = 1536,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        use_hnsw: bool = True,
+        quantize: bool = True,
+        persist_dir: Optional[str] = None
+    ):
         """
         Initialize vector store
         
         Args:
             embedding_dimension: Dimension of OpenAI embeddings (1536 for text-embedding-3-small)
+            embedding_cache: Optional cache for embeddings; a default on-disk cache is used if omitted
+            use_hnsw: Switch to an HNSW index once the corpus reaches HNSW_MIN_VECTORS
+            quantize: Store vectors as int8 once the corpus reaches SQ_MIN_TRAINING_VECTORS
+            persist_dir: Directory the store was loaded from; saved to on clear(), call save() after ingesting
         """
         self.embedding_dimension = embedding_dimension
-        self.index = faiss.IndexFlatIP(embedding_dimension)  # Inner product for similarity
-        self.documents = []  # Store document metadata
-        self.document_count = 0
+        self.use_hnsw = use_hnsw
+        self.quantize = quantize
+        self.persist_dir = persist_dir
+        self.index_kind = self._index_kind(0)
+        self.index = self._create_index()
+        self._reset_metadata()
+        self.version = 0  # Bumped whenever the indexed contents change
         
-        # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
-        self.openai_client = OpenAI(api_key=api_key)
+        # Shared OpenAI client
+        self.openai_client = client
         
         # Embedding model
         self.embedding_model = "text-embedding-3-small"
+        
+        # On-disk embedding cache so re-ingested chunks skip the API
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
+    
+    def _reset_metadata(self) -> None:
+        """Reset per-chunk metadata, stored as parallel arrays indexed by vector position"""
+        self.sources: List[str] = []
+        self.contents: List[str] = []
+        self.chunk_ids: List[int] = []
+        self.file_types: List[str] = []
+        self.by_source: Dict[str, List[int]] = defaultdict(list)  # Source -> vector positions
+        self.document_count = 0
+    
+    def _chunk_record(self, idx: int) -> Dict[str, Any]:
+        """Assemble the metadata dictionary for the chunk at a vector position"""
+        return {
+            'source': self.sources[idx],
+            'content': self.contents[idx],
+            'chunk_id': self.chunk_ids[idx],
+            'file_type': self.file_types[idx],
+            'vector_index': idx
+        }
+    
+    def _index_kind(self, num_vectors: int) -> str:
+        """Choose the index type ('flat', 'hnsw' or 'sq8') for a corpus size"""
+        if self.quantize and num_vectors >= self.SQ_MIN_TRAINING_VECTORS:
+            return 'sq8'
+        if self.use_hnsw and num_vectors >= self.HNSW_MIN_VECTORS:
+            return 'hnsw'
+        return 'flat'
+    
+    def _create_index(self, num_vectors: int = 0) -> faiss.Index:
+        """
+        Create an empty FAISS index suited to the given corpus size
+        
+        Args:
+            num_vectors: Number of vectors the index will hold
+            
+        Returns:
+            Flat inner-product index for small corpora, HNSW and/or int8-quantized index otherwise
+        """
+        kind = self._index_kind(num_vectors)
+        
+        if kind == 'sq8':
+            if self.use_hnsw:
+                index = faiss.IndexHNSWSQ(
+                    self.embedding_dimension,
+                    faiss.ScalarQuantizer.QT_8bit,
+                    self.HNSW_M,
+                    faiss.METRIC_INNER_PRODUCT
+                )
+                index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+                index.hnsw.efSearch = self.HNSW_EF_SEARCH
+                return index
+            return faiss.IndexScalarQuantizer(
+                self.embedding_dimension,
+                faiss.ScalarQuantizer.QT_8bit,
+                faiss.METRIC_INNER_PRODUCT
+            )
+        
+        if kind == 'hnsw':
+            index = faiss.IndexHNSWFlat(self.embedding_dimension, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = self.HNSW_EF_SEARCH
+            return index
+        
+        return faiss.IndexFlatIP(self.embedding_dimension)  # Inner product for similarity
+    
+    def rebuild_index(self, num_vectors: Optional[int] = None) -> None:
+        """
+        Re-insert stored vectors into a fresh index of the appropriate type
+        
+        Args:
+            num_vectors: Keep only the first num_vectors vectors; all are kept if omitted
+        """
+        if num_vectors is None:
+            num_vectors = self.index.ntotal
+        vectors = self.index.reconstruct_n(0, num_vectors) if num_vectors else None
+        
+        self.index_kind = self._index_kind(num_vectors)
+        self.index = self._create_index(num_vectors)
+        if vectors is not None:
+            # The quantizer learns its per-dimension ranges from the buffered full-precision vectors
+            if not self.index.is_trained:
+                self.index.train(vectors)
+            self.index.add(vectors)
     
     def _get_embeddings(self, texts: List[str]) -> np.ndarray:
         """
@@ -35,23 +250,73 @@ class VectorStore:
             texts: List of text strings to embed
             
         Returns:
-            NumPy array of embeddings
+            NumPy array of L2-normalized embeddings
         """
         try:
-            response = self.openai_client.embeddings.create(
-                model=self.embedding_model,
-                input=texts
-            )
+            hashes = [EmbeddingCache.hash_text(text) for text in texts]
+            cached = self.embedding_cache.get_many(hashes, self.embedding_model)
             
-            embeddings = []
-            for embedding_obj in response.data:
-                embeddings.append(embedding_obj.embedding)
+            # Only request embeddings for texts not already cached
+            uncached_indices = [i for i, text_hash in enumerate(hashes) if text_hash not in cached]
+            if uncached_indices:
+                new_embeddings = self._embed_in_batches([texts[i] for i in uncached_indices])
+                new_hashes = [hashes[i] for i in uncached_indices]
+                self.embedding_cache.put_many(new_hashes, new_embeddings, self.embedding_model)
+                cached.update(zip(new_hashes, new_embeddings))
             
-            return np.array(embeddings, dtype=np.float32)
+            # Stack into a fresh, writable float32 array in the original order
+            embeddings = np.vstack([cached[text_hash] for text_hash in hashes])
+            
+            # Normalize in place for cosine similarity, reusing the buffer
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+            
+            return embeddings
             
         except Exception as e:
             raise Exception(f"Error generating embeddings: {str(e)}")
     
+    def _embed_in_batches(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in fixed-size batches, issuing the requests concurrently
+        
+        Args:
+            texts: List of text strings to embed
+            
+        Returns:
+            NumPy array of embeddings in the same order as texts
+        """
+        batch_size = self.EMBEDDING_BATCH_SIZE
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        
+        # executor.map yields results in submission order, so output order matches input
+        with ThreadPoolExecutor(max_workers=min(self.EMBEDDING_MAX_WORKERS, len(batches))) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+        
+        return np.vstack(results)
+    
+    @retry(
+        retry=retry_if_exception_type(RateLimitError),
+        wait=wait_exponential(multiplier=1, min=1, max=30),
+        stop=stop_after_attempt(6),
+        reraise=True
+    )
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed a single batch of texts, retrying with backoff when rate limited"""
+        # Retries are handled by tenacity above, so disable the client's own retry layer
+        response = self.openai_client.with_options(max_retries=0).embeddings.create(
+            model=self.embedding_model,
+            input=texts
+        )
+        
+        return np.array(
+            [embedding_obj.embedding for embedding_obj in response.data],
+            dtype=np.float32
+        )
+    
     def add_documents(self, documents: List[Document]) -> None:
         """
         Add documents to the vector store
@@ -69,28 +334,36 @@ class VectorStore:
             # Generate embeddings
             embeddings = self._get_embeddings(texts)
             
-            # Normalize embeddings for cosine similarity
-            faiss.normalize_L2(embeddings)
-            
             # Add to FAISS index
             self.index.add(embeddings)
             
+            # Promote to HNSW / int8 storage once the corpus is large enough
+            if self._index_kind(self.index.ntotal) != self.index_kind:
+                self.rebuild_index()
+            
             # Store document metadata
-            for i, doc in enumerate(documents):
-                doc_metadata = doc.metadata.copy()
-                doc_metadata.update({
-                    'content': doc.page_content,
-                    'doc_id': self.document_count + i,
-                    'vector_index': len(self.documents) + i
-                })
-                self.documents.append(doc_metadata)
+            for doc in documents:
+                vector_index = len(self.contents)
+                source = doc.metadata.get('source', 'Unknown')
+                self.sources.append(source)
+                self.contents.append(doc.page_content)
+                self.chunk_ids.append(doc.metadata.get('chunk_id', 0))
+                self.file_types.append(doc.metadata.get('file_type', 'unknown'))
+                self.by_source[source].append(vector_index)
             
             self.document_count += len(documents)
+            self.version += 1
             
         except Exception as e:
             raise Exception(f"Error adding documents to vector store: {str(e)}")
     
-    def similarity_search(self, query: str, k: int = 5, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        score_threshold: float = 0.7,
+        source_filter: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for similar documents
         
@@ -98,54 +371,211 @@ class VectorStore:
             query: Search query
             k: Number of results to return
             score_threshold: Minimum similarity score threshold
+            source_filter: Only search chunks from this document source
             
         Returns:
-            List of dictionaries containing document content and metadata
+            List of dictionaries with source, content, score, chunk_id and file_type
         """
         if self.index.ntotal == 0:
             return []
         
+        ids = None
+        if source_filter is not None:
+            ids = self.by_source.get(source_filter)
+            if not ids:
+                return []
+        
         try:
             # Generate query embedding
             query_embedding = self._get_embeddings([query])
-            faiss.normalize_L2(query_embedding)
             
             # Search in FAISS index
-            scores, indices = self.index.search(query_embedding, min(k, self.index.ntotal))
+            if ids is None:
+                scores, indices = self.index.search(query_embedding, min(k, self.index.ntotal))
+            else:
+                scores, indices = self._filtered_search(query_embedding, np.asarray(ids, dtype=np.int64), k)
             
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx >= 0 and score >= score_threshold:  # Valid index and meets threshold
-                    doc_metadata = self.documents[idx].copy()
-                    doc_metadata['score'] = float(score)
-                    results.append(doc_metadata)
+            # Keep valid indices that meet the threshold
+            mask = (indices[0] >= 0) & (scores[0] >= score_threshold)
             
-            return results
+            return [
+                {
+                    'source': self.sources[idx],
+                    'content': self.contents[idx],
+                    'score': score,
+                    'chunk_id': self.chunk_ids[idx],
+                    'file_type': self.file_types[idx]
+                }
+                for idx, score in zip(indices[0][mask].tolist(), scores[0][mask].tolist())
+            ]
             
         except Exception as e:
             raise Exception(f"Error performing similarity search: {str(e)}")
     
+    def _filtered_search(self, query_embedding: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search only the given vector positions
+        
+        Flat and scalar-quantized indexes apply the ID selector during their
+        exhaustive scan. HNSW only drops non-matching results after a graph walk
+        bounded by efSearch, so small filters are scored exactly and larger ones
+        widen efSearch in proportion to how selective the filter is.
+        
+        Args:
+            query_embedding: Normalized query embedding of shape (1, d)
+            ids: Vector positions the search may return
+            k: Number of results to return
+            
+        Returns:
+            Tuple of (scores, indices) arrays of shape (1, n)
+        """
+        k = min(k, len(ids))
+        uses_graph = self.index_kind in ('hnsw', 'sq8') and self.use_hnsw
+        
+        if uses_graph and len(ids) <= self.FILTER_EXACT_MAX_VECTORS:
+            vectors = self.index.reconstruct_batch(ids)
+            scores = vectors @ query_embedding[0]
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return scores[top][np.newaxis, :], ids[top][np.newaxis, :]
+        
+        # The params do not own the selector, so keep a reference for the duration of the search
+        selector = faiss.IDSelectorBatch(ids)
+        if uses_graph:
+            ef_search = int(np.ceil(self.HNSW_EF_SEARCH * self.index.ntotal / len(ids)))
+            search_params = faiss.SearchParametersHNSW(
+                sel=selector,
+                efSearch=min(self.index.ntotal, max(k, ef_search))
+            )
+        else:
+            search_params = faiss.SearchParameters(sel=selector)
+        
+        return self.index.search(query_embedding, k, params=search_params)
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Get statistics about the vector store"""
-        # Count unique documents
-        unique_sources = set()
-        for doc in self.documents:
-            unique_sources.add(doc.get('source', 'Unknown'))
-        
         return {
-            'total_documents': len(unique_sources),
-            'total_chunks': len(self.documents),
+            'total_documents': len(self.by_source),
+            'total_chunks': len(self.contents),
             'index_size': self.index.ntotal,
             'embedding_dimension': self.embedding_dimension,
-            'sources': list(unique_sources)
+            'sources': list(self.by_source),
+            **self.embedding_cache.get_statistics()
         }
     
     def clear(self) -> None:
         """Clear all documents from the vector store"""
-        self.index = faiss.IndexFlatIP(self.embedding_dimension)
-        self.documents = []
-        self.document_count = 0
+        self.index_kind = self._index_kind(0)
+        self.index = self._create_index()
+        self._reset_metadata()
+        self.version += 1
+        
+        if self.persist_dir:
+            self.save(self.persist_dir)
+    
+    def truncate(self, num_chunks: int) -> None:
+        """
+        Remove every chunk added after the first num_chunks
+        
+        Used to roll back a partially ingested document. FAISS graph and
+        quantized indexes cannot delete vectors, so the index is rebuilt.
+        
+        Args:
+            num_chunks: Number of chunks to keep
+        """
+        if num_chunks >= len(self.contents):
+            return
+        
+        removed_sources = set(self.sources[num_chunks:])
+        del self.sources[num_chunks:]
+        del self.contents[num_chunks:]
+        del self.chunk_ids[num_chunks:]
+        del self.file_types[num_chunks:]
+        for source in removed_sources:
+            positions = [idx for idx in self.by_source[source] if idx < num_chunks]
+            if positions:
+                self.by_source[source] = positions
+            else:
+                del self.by_source[source]
+        self.document_count = len(self.contents)
+        
+        self.rebuild_index(num_chunks)
+        self.version += 1
     
     def get_document_by_source(self, source: str) -> List[Dict[str, Any]]:
         """Get all chunks from a specific document source"""
-        return [doc for doc in self.documents if doc.get('source') == source]
+        return [self._chunk_record(idx) for idx in self.by_source.get(source, [])]
+    
+    def save(self, directory: str) -> None:
+        """
+        Save the FAISS index and chunk metadata to a directory
+        
+        Files are written to temporary paths and then renamed, so an
+        interrupted save never leaves a truncated index behind.
+        
+        Args:
+            directory: Directory to write the index and metadata files to
+        """
+        try:
+            os.makedirs(directory, exist_ok=True)
+            index_path = os.path.join(directory, self.INDEX_FILENAME)
+            metadata_path = os.path.join(directory, self.METADATA_FILENAME)
+            
+            faiss.write_index(self.index, index_path + ".tmp")
+            with open(metadata_path + ".tmp", 'wb') as file:
+                pickle.dump({
+                    'index_kind': self.index_kind,
+                    'sources': self.sources,
+                    'contents': self.contents,
+                    'chunk_ids': self.chunk_ids,
+                    'file_types': self.file_types,
+                    'by_source': dict(self.by_source),
+                    'document_count': self.document_count
+                }, file)
+            
+            os.replace(index_path + ".tmp", index_path)
+            os.replace(metadata_path + ".tmp", metadata_path)
+            
+        except Exception as e:
+            raise Exception(f"Error saving vector store: {str(e)}")
+    
+    @classmethod
+    def load(cls, directory: str, **kwargs) -> "VectorStore":
+        """
+        Load a vector store saved with save()
+        
+        Returns an empty store persisting to the directory if nothing has been saved there yet.
+        
+        Args:
+            directory: Directory containing the index and metadata files
+            **kwargs: Additional arguments passed to the constructor
+            
+        Returns:
+            VectorStore instance
+        """
+        store = cls(persist_dir=directory, **kwargs)
+        index_path = os.path.join(directory, cls.INDEX_FILENAME)
+        metadata_path = os.path.join(directory, cls.METADATA_FILENAME)
+        
+        if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            return store
+        
+        try:
+            # IO_FLAG_MMAP only affects IVF inverted lists, so the flat/HNSW/SQ indexes used here are read into memory
+            store.index = faiss.read_index(index_path)
+            
+            with open(metadata_path, 'rb') as file:
+                metadata = pickle.load(file)
+            
+            store.index_kind = metadata['index_kind']
+            store.sources = metadata['sources']
+            store.contents = metadata['contents']
+            store.chunk_ids = metadata['chunk_ids']
+            store.file_types = metadata['file_types']
+            store.by_source = defaultdict(list, metadata['by_source'])
+            store.document_count = metadata['document_count']
+            
+            return store
+            
+        except Exception as e:
+            raise Exception(f"Error loading vector store: {str(e)}")